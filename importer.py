@@ -1,23 +1,183 @@
 import argparse
-import json
+import gzip
 import os
 import re
+import secrets
 import uuid
 import logging
+import multiprocessing
+import threading
+from array import array
+from collections import deque
 import markdown
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from html import escape
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 from bs4 import BeautifulSoup, NavigableString
-from nanoid import generate
+from lxml import etree, html as lhtml
 from tqdm import tqdm
-from rapidfuzz import fuzz
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from rapidfuzz import fuzz, process
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
 logging.basicConfig(level=logging.INFO, filename="log.log")
 logger = logging.getLogger()
 
+# Precompiled patterns for parsing highlights files
+_BLOCK_SPLIT = re.compile(r'\n\n+')
+_GT_STRIP = re.compile(r'^[> ]+')
+
+def _short_id() -> str:
+    """
+    Generate an 8 character highlight short ID
+    Uses the same URL-safe alphabet as nanoid from a single urandom read
+    """
+    return secrets.token_urlsafe(6)
+
+# Omnivore image proxy prefix in front of original image URLs
+_PROXY_HOST = 'proxy-prod.omnivore-image-cache.app'
+_PROXY_URL = re.compile(r'https://proxy-prod\.omnivore-image-cache\.app/\d+x\d+,[A-Za-z0-9_-]+/')
+
+# Markers Omnivore uses to find highlights in saved content
+_HIGHLIGHT_START_TAG = '<span data-omnivore-highlight-start="true"></span>'
+_HIGHLIGHT_END_TAG = '<span data-omnivore-highlight-end="true"></span>'
+
+# Request bodies above this size are gzip-compressed before sending
+_GZIP_MIN_SIZE = 1024
+
+def _dump(obj) -> bytes:
+    """Serialize a GraphQL payload as compact UTF-8 JSON"""
+    return orjson.dumps(obj)
+
+# Markdown instances aren't thread safe, so each import thread keeps its own
+_md_local = threading.local()
+
+def _markdown_to_html(markdown_content: str) -> str:
+    """Convert markdown to HTML reusing this thread's Markdown instance"""
+    md = getattr(_md_local, "md", None)
+    if md is None:
+        md = _md_local.md = markdown.Markdown(output_format='html')
+    return md.reset().convert(markdown_content)
+
+# GraphQL operation bodies, built once at import time and shared by every request
+_QUERIES = {
+    "article_highlights": """
+    query GetArticle($username: String!, $slug: String!) {
+      article(username: $username, slug: $slug) {
+        ... on ArticleSuccess {
+          article {
+            id
+            highlights {
+              id
+              quote
+            }
+          }
+        }
+        ... on ArticleError {
+          errorCodes
+        }
+      }
+    }
+    """,
+    "save_page": """
+    mutation SavePage($input: SavePageInput!) {
+        savePage(input: $input) {
+            ... on SaveSuccess {
+                url
+                clientRequestId
+            }
+            ... on SaveError {
+                errorCodes
+            }
+        }
+    }
+    """,
+    "save_url": """
+    mutation SaveUrl($input: SaveUrlInput!) {
+        saveUrl(input: $input) {
+            ... on SaveSuccess {
+                url
+                clientRequestId
+            }
+            ... on SaveError {
+                errorCodes
+            }
+        }
+    }
+    """,
+    "update_page": """
+    mutation UpdatePage($input: UpdatePageInput!) {
+        updatePage(input: $input) {
+            ... on UpdatePageError {
+                errorCodes
+            }
+        }
+    }
+    """,
+    "set_reading_progress": """
+    mutation SaveArticleReadingProgress($input: SaveArticleReadingProgressInput!) {
+        saveArticleReadingProgress(input: $input) {
+            ... on SaveArticleReadingProgressError {
+                errorCodes
+            }
+        }
+    }
+    """,
+    "archive": """
+    mutation SetLinkArchived($input: ArchiveLinkInput!) {
+        setLinkArchived(input: $input) {
+            ... on ArchiveLinkError {
+                errorCodes
+            }
+        }
+    }
+    """,
+    "update_highlight": """
+    mutation UpdateHighlight($input: UpdateHighlightInput!) {
+        updateHighlight(input: $input) {
+            ... on UpdateHighlightSuccess {
+                highlight {
+                    id
+                }
+            }
+            ... on UpdateHighlightError {
+                errorCodes
+            }
+        }
+    }
+    """,
+    "set_labels_for_highlight": """
+    mutation SetLabelsForHighlight($input: SetLabelsForHighlightInput!) {
+      setLabelsForHighlight(input: $input) {
+        ... on SetLabelsSuccess {
+          labels {
+            id
+          }
+        }
+      }
+    }
+    """,
+    "create_highlight": """
+    mutation CreateHighlight($input: CreateHighlightInput!) {
+        createHighlight(input: $input) {
+            ... on CreateHighlightSuccess {
+                highlight {
+                    id
+                }
+            }
+            ... on CreateHighlightError {
+                errorCodes
+            }
+        }
+    }
+    """,
+}
+# Collapse indentation so it isn't re-sent on every request
+_QUERIES = {name: ' '.join(query.split()) for name, query in _QUERIES.items()}
+
 # Main API client class for interacting with Omnivore's GraphQL API
 class OmnivoreAPI:
     def __init__(self, api_url: str, api_key: str, verify_certs: bool = True):
@@ -26,81 +186,104 @@ class OmnivoreAPI:
         self.api_key = api_key
         self.verify_certs = verify_certs;
 
-    def gql_request(self, query: str, retry: bool = False) -> Dict:
+        # Persistent session so every request reuses pooled keep-alive connections
+        # Transient server errors and rate limiting are retried with exponential backoff
+        retry = Retry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['POST']),
+            respect_retry_after_header=True
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=4, pool_maxsize=32)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Accept': 'application/json',
+            'Content-Type': 'application/json',
+            'Authorization': self.api_key
+        })
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Close the underlying HTTP session and its pooled connections"""
+        self.session.close()
+
+    def _post(self, data: bytes) -> requests.Response:
+        """
+        POST a JSON body to the API
+        Bodies larger than _GZIP_MIN_SIZE are sent gzip-compressed
+        """
+        headers = None
+        if len(data) > _GZIP_MIN_SIZE:
+            data = gzip.compress(data)
+            headers = {'Content-Encoding': 'gzip'}
+        # verify is passed per request so REQUESTS_CA_BUNDLE can't override it
+        return self.session.post(self.api_url, data=data, headers=headers,
+                                 verify=self.verify_certs)
+
+    def gql_request(self, query: bytes) -> Dict:
         """
         Make a GraphQL request to Omnivore API
         Handles authentication and basic error checking
-        Optionally retries failed requests once if retry=True
+        Transient failures are retried by the session's transport adapter
         """
-        headers = {
-            'Accept': 'application/json',
-            'Content-Type': 'application/json',
-            'Authorization': self.api_key
-        }
-        for n in range(retry * 1 + 1):
-            try:       
-                response = requests.post(
-                    self.api_url,
-                    headers=headers,
-                    data=query,
-                    verify=self.verify_certs
-                )
-                data = response.json()
-            except requests.exceptions.JSONDecodeError:
-                continue
-            else:
-                break
+        response = self._post(query)
+        data = orjson.loads(response.content)
                 
         if 'data' not in data:
             raise Exception(f'No response data: {data}')
         return data['data']
 
-    def get_all_highlighted_articles(self) -> str:
+    def gql_batch(self, queries: List[bytes]) -> List[Dict]:
         """
-        Generate GraphQL query to fetch all articles that contain highlights
-        Returns formatted JSON string with the query
+        Make a batched GraphQL request to Omnivore API
+        Sends already-built queries as a single JSON array in one HTTP request
+        Returns the data of each operation in the same order as the queries
         """
-        return json.dumps({
-            "query": """
-            query Search {
-              search(query: "has:highlights") {
-                ... on SearchSuccess {
-                  edges {
-                    node {
-                      id
-                      highlights {
-                        id
-                        quote
-                      }
-                    }
-                  }
-                }
-              }
+        if not queries:
+            return []
+        response = self._post(b'[' + b','.join(queries) + b']')
+        results = orjson.loads(response.content)
+        if not isinstance(results, list):
+            raise Exception(f'No batched response data: {results}')
+
+        data = []
+        for result in results:
+            if 'data' not in result:
+                raise Exception(f'No response data: {result}')
+            data.append(result['data'])
+        return data
+
+    def get_article_highlights(self, page_id: str) -> bytes:
+        """
+        Generate GraphQL query to fetch the highlights of a single article
+        The API accepts the article ID in place of its slug
+        Returns JSON-encoded bytes with the query
+        """
+        return _dump({
+            "query": _QUERIES["article_highlights"],
+            "variables": {
+                "username": "me",
+                "slug": page_id
             }
-            """
         })
 
     def save_page_mutation(self, url: str, content: str, title: str, 
-                          labels: List[Dict], source: str = "api_import") -> str:
+                          labels: List[Dict], source: str = "api_import") -> bytes:
         """
         Create GraphQL mutation to save a new page/article
         Includes URL, content, title, labels and generates a unique client ID
-        Returns formatted JSON string with the mutation
+        Returns JSON-encoded bytes with the mutation
         """
-        return json.dumps({
-            "query": """
-            mutation SavePage($input: SavePageInput!) {
-                savePage(input: $input) {
-                    ... on SaveSuccess {
-                        url
-                        clientRequestId
-                    }
-                    ... on SaveError {
-                        errorCodes
-                    }
-                }
-            }
-            """,
+        return _dump({
+            "query": _QUERIES["save_page"],
             "variables": {
                 "input": {
                     "url": url,
@@ -113,25 +296,13 @@ class OmnivoreAPI:
             }
         })
 
-    def save_url_mutation(self, url: str, labels: List[Dict], source: str = "api_import") -> str:
+    def save_url_mutation(self, url: str, labels: List[Dict], source: str = "api_import") -> bytes:
         """
         Create GraphQL mutation to save a new page/article using only URL
-        Returns formatted JSON string with the mutation
+        Returns JSON-encoded bytes with the mutation
         """
-        return json.dumps({
-            "query": """
-            mutation SaveUrl($input: SaveUrlInput!) {
-                saveUrl(input: $input) {
-                    ... on SaveSuccess {
-                        url
-                        clientRequestId
-                    }
-                    ... on SaveError {
-                        errorCodes
-                    }
-                }
-            }
-            """,
+        return _dump({
+            "query": _QUERIES["save_url"],
             "variables": {
                 "input": {
                     "url": url,
@@ -142,7 +313,7 @@ class OmnivoreAPI:
             }
         })
 
-    def update_page_mutation(self, page_id: str, metadata: Dict) -> str:
+    def update_page_mutation(self, page_id: str, metadata: Dict) -> bytes:
         """
         Create GraphQL mutation to update page metadata
         Handles description, author, timestamps, and preview image
@@ -158,36 +329,20 @@ class OmnivoreAPI:
             "previewImage": metadata["thumbnail"]
         }
         
-        return json.dumps({
-            "query": """
-            mutation UpdatePage($input: UpdatePageInput!) {
-                updatePage(input: $input) {
-                    ... on UpdatePageError {
-                        errorCodes
-                    }
-                }
-            }
-            """,
+        return _dump({
+            "query": _QUERIES["update_page"],
             "variables": {
                 "input": {k: v for k, v in input_data.items() if v is not None}
             }
         })
 
-    def set_reading_progress_mutation(self, page_id: str, progress: int) -> str:
+    def set_reading_progress_mutation(self, page_id: str, progress: int) -> bytes:
         """
         Create GraphQL mutation to update reading progress
         Progress is an integer percentage (0-100)
         """
-        return json.dumps({
-            "query": """
-            mutation SaveArticleReadingProgress($input: SaveArticleReadingProgressInput!) {
-                saveArticleReadingProgress(input: $input) {
-                    ... on SaveArticleReadingProgressError {
-                        errorCodes
-                    }
-                }
-            }
-            """,
+        return _dump({
+            "query": _QUERIES["set_reading_progress"],
             "variables": {
                 "input": {
                     "id": page_id,
@@ -197,21 +352,13 @@ class OmnivoreAPI:
         })
 
 
-    def archive_mutation(self, page_id: str) -> str:
+    def archive_mutation(self, page_id: str) -> bytes:
         """
         Create GraphQL mutation to set page to archived
         """
         
-        return json.dumps({
-            "query": """
-            mutation SetLinkArchived($input: ArchiveLinkInput!) {
-                setLinkArchived(input: $input) {
-                    ... on ArchiveLinkError {
-                        errorCodes
-                    }
-                }
-            }
-            """,
+        return _dump({
+            "query": _QUERIES["archive"],
             "variables": {
                 "input": {
                     "linkId": page_id,
@@ -220,26 +367,13 @@ class OmnivoreAPI:
             }
         })
 
-    def update_highlight_mutation(self, highlight_id: str, annotation: str) -> str:
+    def update_highlight_mutation(self, highlight_id: str, annotation: str) -> bytes:
         """
         Create GraphQL mutation to update an existing highlight
         Can add or modify the annotation (note) attached to the highlight
         """
-        return json.dumps({
-            "query": """
-            mutation UpdateHighlight($input: UpdateHighlightInput!) {
-                updateHighlight(input: $input) {
-                    ... on UpdateHighlightSuccess {
-                        highlight {
-                            id
-                        }
-                    }
-                    ... on UpdateHighlightError {
-                        errorCodes
-                    }
-                }
-            }
-            """,
+        return _dump({
+            "query": _QUERIES["update_highlight"],
             "variables": {
                 "input": {
                     "highlightId": highlight_id,
@@ -248,23 +382,13 @@ class OmnivoreAPI:
             }
         })
 
-    def set_label_for_highlight_mutation(self, highlight_id: str, labels: Dict) -> str:
+    def set_label_for_highlight_mutation(self, highlight_id: str, labels: Dict) -> bytes:
         """
         Create GraphQL mutation to set labels for a highlight
         Labels help organize and categorize highlights
         """
-        return json.dumps({
-            "query": """
-            mutation SetLabelsForHighlight($input: SetLabelsForHighlightInput!) {
-              setLabelsForHighlight(input: $input) {
-                ... on SetLabelsSuccess {
-                  labels {
-                    id
-                  }
-                }
-              }
-            }
-            """,
+        return _dump({
+            "query": _QUERIES["set_labels_for_highlight"],
             "variables": {
                 "input": {
                     "highlightId": highlight_id,
@@ -273,30 +397,17 @@ class OmnivoreAPI:
             }
         })
 
-    def create_highlight_mutation(self, page_id: str, quote: str, annotation: Optional[str] = None) -> str:
+    def create_highlight_mutation(self, page_id: str, quote: str, annotation: Optional[str] = None) -> bytes:
         """
         Create GraphQL mutation to save a new highlight
         Generates unique IDs for the highlight
         Can include an optional annotation (note)
         """
         highlight_id = str(uuid.uuid4())
-        short_id = generate(size=8)
+        short_id = _short_id()
         
-        return json.dumps({
-            "query": """
-            mutation CreateHighlight($input: CreateHighlightInput!) {
-                createHighlight(input: $input) {
-                    ... on CreateHighlightSuccess {
-                        highlight {
-                            id
-                        }
-                    }
-                    ... on CreateHighlightError {
-                        errorCodes
-                    }
-                }
-            }
-            """,
+        return _dump({
+            "query": _QUERIES["create_highlight"],
             "variables": {
                 "input": {
                     "id": highlight_id,
@@ -309,29 +420,16 @@ class OmnivoreAPI:
             }
         })
 
-    def create_note_mutation(self, page_id: str, note: str) -> str:
+    def create_note_mutation(self, page_id: str, note: str) -> bytes:
         """
         Create GraphQL mutation to save an article-level note
         Similar to create_highlight but specifically for standalone notes
         """
         note_id = str(uuid.uuid4())
-        short_id = generate(size=8)
+        short_id = _short_id()
         
-        return json.dumps({
-            "query": """
-            mutation CreateHighlight($input: CreateHighlightInput!) {
-                createHighlight(input: $input) {
-                    ... on CreateHighlightSuccess {
-                        highlight {
-                            id
-                        }
-                    }
-                    ... on CreateHighlightError {
-                        errorCodes
-                    }
-                }
-            }
-            """,
+        return _dump({
+            "query": _QUERIES["create_highlight"],
             "variables": {
                 "input": {
                     "id": note_id,
@@ -343,20 +441,23 @@ class OmnivoreAPI:
             }
         })
 
-def html_to_text_map(html_content: str) -> Tuple[str, list]:
+def html_to_text_map(html_content: str) -> Tuple[str, array]:
     """
     Convert HTML to plain text while maintaining a mapping of text positions 
     to HTML positions.
     """
     soup = BeautifulSoup(html_content, 'html.parser')
     plain_text = []
-    position_map = []
+    position_map = array('i')
     html_pos = 0
     
     EXCLUDED_TAGS = {'style', 'script'}
     
-    def process_node(node):
-        nonlocal html_pos
+    # Walk the tree with an explicit stack, children pushed in reverse so they
+    # are visited in document order without recursing on deep DOMs
+    stack = deque([soup])
+    while stack:
+        node = stack.pop()
         
         if isinstance(node, NavigableString):
             if node.parent.name not in EXCLUDED_TAGS:
@@ -364,100 +465,75 @@ def html_to_text_map(html_content: str) -> Tuple[str, list]:
                 # Skip whitespace-only strings
                 if not node_str.strip():
                     html_pos += len(node_str)
-                    return
+                    continue
                     
                 # Find position of this text in original HTML
-                original_pos = html_pos
-                while html_pos < len(html_content):
-                    if html_content[html_pos:].startswith(escape(node_str)):
-                        break
-                    html_pos += 1
+                found = html_content.find(escape(node_str), html_pos)
                 
-                # If we couldn't find the exact text, revert and try with stripped version
-                if html_pos >= len(html_content):
-                    html_pos = original_pos
+                # If we couldn't find the exact text, try with stripped version
+                if found < 0:
                     node_str = node_str.strip()
-                    while html_pos < len(html_content):
-                        if html_content[html_pos:].startswith(escape(node_str)):
-                            break
-                        html_pos += 1
+                    found = html_content.find(escape(node_str), html_pos)
+                    if found < 0:
+                        found = len(html_content)
                 
                 # Map each character position
-                for i, char in enumerate(node_str):
-                    plain_text.append(char)
-                    position_map.append(html_pos + i)
+                plain_text.append(node_str)
+                position_map.extend(range(found, found + len(node_str)))
                 
-                html_pos += len(node_str)
+                html_pos = found + len(node_str)
         
-        if hasattr(node, 'children'):
-            for child in node.children:
-                process_node(child)
+        elif hasattr(node, 'children'):
+            stack.extend(reversed(node.contents))
     
-    process_node(soup)
     return ''.join(plain_text), position_map
 
 def find_best_match(text: str, pattern: str, cutoff: float = 0.9) -> Tuple[Optional[int], Optional[int], float]:
     """
     Find the best fuzzy match with more precise boundary detection.
     """
-    text_words = text.split()
-    pattern_words = pattern.split()
-    window_size = len(pattern_words)
-    best_start_index = None
-    best_end_index = None
-    best_ratio = 0.0
-    
     # Try exact match first
     if pattern in text:
         start = text.index(pattern)
         return start, start + len(pattern), 1.0
     
+    # Find the best aligned substring of text in a single C++ pass
+    alignment = fuzz.partial_ratio_alignment(pattern, text, score_cutoff=cutoff * 100)
+    if alignment is None:
+        return None, None, 0.0
+    
+    char_start_index = alignment.dest_start
+    char_end_index = alignment.dest_end
+    
     # Get the first word of the pattern for boundary checking
+    pattern_words = pattern.split()
     first_pattern_word = pattern_words[0] if pattern_words else ""
     
-    # Sliding window over tokenized words with variable window size
-    for window in tqdm(range(window_size - 1, window_size + 2), desc="Fuzzy matching windows", unit="windows", disable=True):  # Try different window sizes
-        for i in range(len(text_words) - window + 1):
-            candidate_words = text_words[i:i + window]
-            candidate = ' '.join(candidate_words)
-            
-            # Compute similarity ratio
-            ratio = fuzz.ratio(candidate, pattern)
-            if ratio > best_ratio and ratio >= cutoff:
-                # Calculate character-level indices in original text
-                prefix = ' '.join(text_words[:i])
-                char_start_index = len(prefix) + (1 if i > 0 else 0)
-                char_end_index = char_start_index + len(candidate)
-                
-                # Only adjust start boundary if we don't have an exact match for the first word
-                if not text_words[i].startswith(first_pattern_word):
-                    while (char_start_index > 0 and 
-                           text[char_start_index - 1].isalnum()):
-                        char_start_index -= 1
-                
-                # Adjust end boundary if needed
-                while (char_end_index < len(text) and 
-                       text[char_end_index - 1].isalnum()):
-                    char_end_index += 1
-                
-                best_start_index = char_start_index
-                best_end_index = char_end_index
-                best_ratio = ratio
+    # Only adjust start boundary if we don't have an exact match for the first word
+    if not text.startswith(first_pattern_word, char_start_index):
+        while (char_start_index > 0 and 
+               text[char_start_index - 1].isalnum()):
+            char_start_index -= 1
+    
+    # Adjust end boundary if needed
+    while (char_end_index < len(text) and 
+           text[char_end_index - 1].isalnum()):
+        char_end_index += 1
     
-    return best_start_index, best_end_index, best_ratio
+    return char_start_index, char_end_index, alignment.score / 100
 
-def find_markdown_in_html(html_content: str, markdown_content: str) -> Tuple[Optional[str], Optional[int], Optional[int], float]:
+def find_markdown_in_text(html_text: str, position_map: array, html_content: str,
+                          markdown_content: str) -> Tuple[Optional[str], Optional[int], Optional[int], float]:
     """
     Find the portion of HTML that corresponds to the given Markdown content.
+    html_text and position_map are the output of html_to_text_map(html_content)
+    so they can be computed once and reused for every highlight.
     """
     # Convert markdown to text
-    md_html = markdown.markdown(markdown_content)
+    md_html = _markdown_to_html(markdown_content)
     md_soup = BeautifulSoup(md_html, 'html.parser')
     md_text = md_soup.get_text()
 
-    # Convert HTML to text while maintaining position mapping
-    html_text, position_map = html_to_text_map(html_content)
-    
     # Find best matching span in the text
     start_idx, end_idx, similarity = find_best_match(html_text, md_text)
     
@@ -477,59 +553,87 @@ def find_markdown_in_html(html_content: str, markdown_content: str) -> Tuple[Opt
     return matching_html, html_start, html_end, similarity
 
 
+def _clean_tree(root) -> str:
+    """
+    Clean a parsed lxml HTML document in place and serialize it
+    Removes comments, data- attributes and image proxy prefixes in a single pass
+    """
+    for element in list(root.iter()):
+        if isinstance(element, etree._Comment):
+            element.drop_tree()
+            continue
+        for attr, value in list(element.attrib.items()):
+            if attr.startswith('data-'):
+                del element.attrib[attr]
+            elif _PROXY_HOST in value:
+                element.attrib[attr] = _PROXY_URL.sub('', value)
+        if element.text and _PROXY_HOST in element.text:
+            element.text = _PROXY_URL.sub('', element.text)
+        if element.tail and _PROXY_HOST in element.tail:
+            element.tail = _PROXY_URL.sub('', element.tail)
+
+    return lhtml.tostring(root, encoding='unicode')
+
 def clean_html(html_content):
     """
     Clean and standardize HTML content
     - Wraps content in html/body tags
-    - Strips data- attributes
+    - Strips data- attributes and comments
     - Normalizes whitespace
     - Replace proxy with original URL
     """
-    html_content = "<html><body>" + html_content + "</body></html>"
-
-    proxy_regex = r'https://proxy-prod\.omnivore-image-cache\.app/\d+x\d+,[A-Za-z0-9_-]+/'
-
-    html_content = re.sub(proxy_regex, '', html_content)
+    return _clean_tree(lhtml.document_fromstring("<html><body>" + html_content + "</body></html>"))
 
-    soup = BeautifulSoup(html_content, 'html.parser')
-
-    # Remove data attributes
-    for tag in soup.find_all(lambda t: any(i.startswith('data-') for i in t.attrs)):
-        for attr in list(tag.attrs):
-            if attr.startswith('data-'):
-                del tag.attrs[attr]
-
-    return str(soup)
-
-def find_closest_match(target: str, candidates: list[str]) -> str:
+def clean_html_file(file_path: str) -> str:
+    """
+    Same as clean_html, but parses the file directly with lxml
+    so the raw HTML is never held in memory as a separate string
+    """
+    # Archived article files are UTF-8 and usually have no charset declaration
+    parser = lhtml.HTMLParser(encoding='utf-8')
+    root = lhtml.parse(file_path, parser=parser).getroot()
+    if root is None:
+        return clean_html("")
+    return _clean_tree(root)
+
+def find_closest_match(target: str, candidates: list[str], score_cutoff: float = 0) -> Optional[str]:
     """
     Find the most similar string in a list compared to a target string
-    Uses SequenceMatcher to calculate similarity ratios
+    Uses a case-insensitive RapidFuzz ratio to compare candidates
+    Returns None if no candidate scores at least score_cutoff (0-100)
     Useful for matching highlight quotes that might have slight differences
     """
     if not candidates:
         raise ValueError("Candidates list cannot be empty")
         
-    def similarity(a: str, b: str) -> float:
-        return fuzz.ratio(None, a.lower(), b.lower()).ratio()
-    
-    closest = max(candidates, key=lambda x: similarity(target, x))
+    match = process.extractOne(target, candidates, scorer=fuzz.ratio, processor=str.lower,
+                               score_cutoff=score_cutoff)
     
-    return closest
+    return match[0] if match else None
 
-def add_highlight_tag(content: str, highlight: Dict) -> str:
+def add_highlight_tags(content: str, highlights: List[Dict]) -> str:
     """
     Add Omnivore highlight markers to HTML content
-    Inserts span tags at the start and end of highlighted text
+    Inserts span tags at the start and end of each highlighted text
+    All offsets refer to the original content, which is copied only once
     Returns modified HTML string
     """
-    logger.info(f"adding highlight tag")
-    output = (content[:highlight["start_index"]] +
-             '<span data-omnivore-highlight-start="true"></span>' +
-             content[highlight["start_index"]:highlight["end_index"]] +
-             '<span data-omnivore-highlight-end="true"></span>' +
-             content[highlight["end_index"]:])
-    return output
+    logger.info(f"adding highlight tags={len(highlights)}")
+    # End markers sort before start markers at the same offset
+    markers = []
+    for highlight in highlights:
+        markers.append((highlight["start_index"], 1, _HIGHLIGHT_START_TAG))
+        markers.append((highlight["end_index"], 0, _HIGHLIGHT_END_TAG))
+    markers.sort()
+
+    parts = []
+    pos = 0
+    for index, _, tag in markers:
+        parts.append(content[pos:index])
+        parts.append(tag)
+        pos = index
+    parts.append(content[pos:])
+    return ''.join(parts)
 
 def parse_highlights_file(file_path: str) -> Dict:
     """
@@ -547,7 +651,7 @@ def parse_highlights_file(file_path: str) -> Dict:
     except FileNotFoundError:
         return {"article_note": None, "highlights": []}
 
-    blocks = re.split(r'\n\n+', content.strip())
+    blocks = _BLOCK_SPLIT.split(content.strip())
     
     result = {
         "article_note": None,
@@ -564,7 +668,7 @@ def parse_highlights_file(file_path: str) -> Dict:
             if current_highlight:
                 result["highlights"].append(current_highlight)
             
-            quote = '\n'.join([x.lstrip('> ').strip() for x in lines])
+            quote = '\n'.join([_GT_STRIP.sub('', x).strip() for x in lines])
             current_highlight = {
                 "quote": quote,
                 "labels": [],
@@ -597,9 +701,11 @@ def parse_highlights_file(file_path: str) -> Dict:
 
 
 def save_page(api, metadata: Dict, content: Optional[str] = None, 
-              highlights_data: Optional[Dict] = None) -> str:
+              highlights_data: Optional[Dict] = None,
+              cpu_pool: Optional[Executor] = None) -> str:
     """
     Save a new page to Omnivore with optional content and highlights
+    Highlight matching runs on cpu_pool when given, so it doesn't hold the GIL
     Returns the page ID if successful
     """
     labels = [{"name": label} for label in metadata.get("labels", [])]
@@ -607,7 +713,10 @@ def save_page(api, metadata: Dict, content: Optional[str] = None,
     if content:
         if highlights_data:
             logger.debug(f"getting highlights_in_content")
-            content = process_highlights_in_content(content, highlights_data)
+            if cpu_pool is not None:
+                content = cpu_pool.submit(process_highlights_in_content, content, highlights_data).result()
+            else:
+                content = process_highlights_in_content(content, highlights_data)
         logger.debug(f"generating save_page_mutation")
         save_page_mutation = api.save_page_mutation(
             url=metadata["url"],
@@ -641,111 +750,131 @@ def process_highlights_in_content(content: str, highlights_data: Dict) -> str:
 
     num_highlights = len(highlights_data['highlights'])
     logger.info(f"processing highlights={num_highlights}")
+    # Map the untouched content once; tags are only inserted after all matching
+    # so the positions stay valid for every highlight
+    html_text, position_map = html_to_text_map(content)
+    matched = []
     for index, highlight in enumerate(tqdm(highlights_data["highlights"], desc="highlights in article", disable=False)):
-        html_content, start_index, end_index, ratio = find_markdown_in_html(content, highlight["quote"])
+        html_content, start_index, end_index, ratio = find_markdown_in_text(html_text, position_map, content, highlight["quote"])
         if start_index:
             logger.info(f'adding highlight #{index}/{num_highlights}: start_index={start_index}, highlight end_index={end_index}, similarity={ratio}')
             highlight["html"] = html_content
             highlight["start_index"] = start_index
             highlight["end_index"] = end_index
             highlight["ratio"] = ratio
-            content = add_highlight_tag(content, highlight)
+            matched.append(highlight)
         else:
             logger.error(f"Failed to import highlight #{index}/{num_highlights}: {highlight['quote'][:50]}...")
-    return content
 
-def update_page_metadata(api, page_id: str, metadata: Dict):
-    """Update page metadata including reading progress"""
-    metadata_mutation = api.update_page_mutation(
+    return add_highlight_tags(content, matched)
+
+def update_page_metadata(api, page_id: str, metadata: Dict) -> List[bytes]:
+    """Build mutations to update page metadata including reading progress"""
+    mutations = [api.update_page_mutation(
         page_id=page_id,
         metadata=metadata
-    )
-    api.gql_request(metadata_mutation)
+    )]
 
     if metadata["state"] == "Archived":
-        archive_mutation = api.archive_mutation(
-            page_id = page_id)
-        api.gql_request(archive_mutation)
+        mutations.append(api.archive_mutation(
+            page_id = page_id))
     
     if metadata["readingProgress"] > 0:
-        reading_progress_mutation = api.set_reading_progress_mutation(
+        mutations.append(api.set_reading_progress_mutation(
             page_id=page_id,
             progress=metadata["readingProgress"]
-        )
-        api.gql_request(reading_progress_mutation)
-
-def process_article_note(api, page_id: str, article_note: str):
-    """Add article-level note if it exists"""
-    if article_note:
-        note_mutation = api.create_note_mutation(
-            page_id=page_id,
-            note=article_note
-        )
-        api.gql_request(note_mutation)
+        ))
+    return mutations
+
+def process_article_note(api, page_id: str, article_note: str) -> List[bytes]:
+    """Build mutation for article-level note if it exists"""
+    if not article_note:
+        return []
+    return [api.create_note_mutation(
+        page_id=page_id,
+        note=article_note
+    )]
 
-def process_highlights(api, page_id: str, highlights_data: Dict):
-    """Process and add highlights, their notes, and labels"""
+def process_highlights(api, page_id: str, highlights_data: Dict, article_result: Dict):
+    """
+    Process and add highlights, their notes, and labels
+    article_result is the response to get_article_highlights for the page
+    """
     if not highlights_data or not highlights_data["highlights"]:
         return
         
-    highlights_query = api.get_all_highlighted_articles()
-    all_highlights = api.gql_request(highlights_query, retry=True)
-    page_highlights = [x["node"]["highlights"] for x in all_highlights['search']['edges'] 
-                      if x['node']['id'] == page_id]
+    page_highlights = article_result['article'].get('article', {}).get('highlights')
     
     if not page_highlights:
         logger.info(f"no highlights processed for pageId={page_id}")
         return
         
+    # Index stored quotes so verbatim matches skip fuzzy matching entirely
+    quote_to_id = {}
+    for x in page_highlights:
+        if x["quote"]:
+            quote_to_id.setdefault(x["quote"], x["id"])
+    highlight_quotes = list(quote_to_id)
+    
+    mutations = []
     for highlight in highlights_data["highlights"]:
         logger.info(f"processing highlight={highlight}")
-        highlight_quotes = [x["quote"] for x in page_highlights[0] if x["quote"]]
-        closest_match = find_closest_match(highlight["quote"], highlight_quotes)
-        highlight_result = [x for x in page_highlights[0] if x["quote"] == closest_match]
+        highlight_id = quote_to_id.get(highlight["quote"])
+        if highlight_id is None and highlight_quotes:
+            closest_match = find_closest_match(highlight["quote"], highlight_quotes, score_cutoff=60)
+            highlight_id = quote_to_id.get(closest_match)
         
-        if not highlight_result:
+        if highlight_id is None:
             continue
             
         if highlight["notes"]:
-            highlight_note_mutation = api.update_highlight_mutation(
-                highlight_id=highlight_result[0]["id"],
+            mutations.append(api.update_highlight_mutation(
+                highlight_id=highlight_id,
                 annotation=highlight["notes"]
-            )
-            api.gql_request(highlight_note_mutation)
+            ))
             
         if highlight["labels"]:
-            highlight_label_mutation = api.set_label_for_highlight_mutation(
-                highlight_id=highlight_result[0]["id"],
+            mutations.append(api.set_label_for_highlight_mutation(
+                highlight_id=highlight_id,
                 labels=highlight["labels"]
-            )
-            api.gql_request(highlight_label_mutation)
+            ))
+
+    # Send all note and label updates for this article in one round trip
+    api.gql_batch(mutations)
 
 def import_article(api, metadata: Dict, content: Optional[str] = None,
-                  highlights_data: Optional[Dict] = None) -> str:
+                  highlights_data: Optional[Dict] = None,
+                  cpu_pool: Optional[Executor] = None) -> str:
     """
     Import a single article with its content, highlights, and labels
     Main orchestration function that calls other specialized functions
     """
     # Save the page and get its ID
     logger.debug(f"about to save page")
-    page_id = save_page(api, metadata, content, highlights_data)
+    page_id = save_page(api, metadata, content, highlights_data, cpu_pool)
     logger.info(f"Saved page: {page_id}. Now updating metadata")
     # Update page metadata and reading progress
-    update_page_metadata(api, page_id, metadata)
-    logger.info(f"updated metadata, now moving to highlights data")
-    # Process highlights if they exist
+    mutations = update_page_metadata(api, page_id, metadata)
+    # Add article-level note
     if highlights_data:
-        # Add article-level note
         logger.info(f"processing article-level note")
-        process_article_note(api, page_id, highlights_data["article_note"])
-        
+        mutations.extend(process_article_note(api, page_id, highlights_data["article_note"]))
+    # The highlights query only depends on the page ID, so it rides along
+    has_highlights = bool(highlights_data and highlights_data["highlights"])
+    if has_highlights:
+        mutations.append(api.get_article_highlights(page_id))
+    # Send metadata, note and highlights query together in one round trip
+    results = api.gql_batch(mutations)
+    logger.info(f"updated metadata, now moving to highlights data")
+    # Process highlights if they exist
+    if has_highlights:
         # Process highlights, their notes and labels
         logger.info(f"processing article highlights, notes, and labels")
-        process_highlights(api, page_id, highlights_data)
+        process_highlights(api, page_id, highlights_data, results[-1])
     
     return page_id
 
-def process_article(article, content_dir, highlights_dir, api):
+def process_article(article, content_dir, highlights_dir, api, cpu_pool=None):
     url = article['url']
     slug = article['slug']
     
@@ -755,8 +884,7 @@ def process_article(article, content_dir, highlights_dir, api):
     content_file = os.path.join(content_dir, f"{slug}.html")
     content = None
     if os.path.exists(content_file):
-        with open(content_file, 'r', encoding='utf-8') as f:
-            content = clean_html(f.read())
+        content = clean_html_file(content_file)
     
     # Get highlights if available
     highlights_file = os.path.join(highlights_dir, f"{slug}.md")
@@ -767,51 +895,77 @@ def process_article(article, content_dir, highlights_dir, api):
             api=api,
             metadata=article,
             content=content,
-            highlights_data=highlights_data
+            highlights_data=highlights_data,
+            cpu_pool=cpu_pool
         )
     except Exception as e:
         logger.error(f"Failed to import {article['title']}", exc_info=True)
 
-def import_folder(api, folder_path: str):
-    """Import an entire folder of content into Omnivore"""
+def load_metadata_file(json_file: Path) -> List[Dict]:
+    """
+    Load article metadata from a single JSON file of the archive
+    Returns a list of articles, empty if the file can't be read
+    """
+    try:
+        with open(json_file, 'rb') as file:
+            # Load JSON data
+            data = orjson.loads(file.read())
+            
+        logger.info(f"Successfully processed: {json_file.name}")
+        # If the data is already a list, use it as is
+        if isinstance(data, list):
+            return data
+        # If it's a single object, wrap it
+        return [data]
+    except orjson.JSONDecodeError as e:
+        logger.error(f"Error reading {json_file.name}: Invalid JSON format", exc_info=True)
+    except Exception as e:
+        logger.error(f"Error processing {json_file.name}", exc_info=True)
+    return []
+
+def import_folder(api, folder_path: str, num_threads: int = 8):
+    """
+    Import an entire folder of content into Omnivore
+    Articles are imported concurrently across num_threads worker threads,
+    with CPU-bound highlight matching spread over a process pool
+    """
 
     path = Path(folder_path)
-    # Load metadata
+    # Load metadata from all JSON files in the directory in parallel
     metadata = []
-
-    
-    # Iterate through all JSON files in the directory
-    for json_file in path.glob('*.json'):
-        try:
-            with open(json_file, 'r', encoding='utf-8') as file:
-                # Load JSON data
-                data = json.load(file)
-                
-                # If the data is already a list, extend combined_data
-                if isinstance(data, list):
-                    metadata.extend(data)
-                # If it's a single object, append it
-                else:
-                    metadata.append(data)
-                    
-            logger.info(f"Successfully processed: {json_file.name}")
-        except json.JSONDecodeError as e:
-            logger.error(f"Error reading {json_file.name}: Invalid JSON format", exc_info=True)
-        except Exception as e:
-            logger.error(f"Error processing {json_file.name}", exc_info=True)
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        for articles in executor.map(load_metadata_file, path.glob('*.json')):
+            metadata.extend(articles)
             
     content_dir = os.path.join(folder_path, "content")
     highlights_dir = os.path.join(folder_path, "highlights")
-    num_threads = 8
-    with tqdm(total=len(metadata), desc="Processing Articles") as pbar:
-        with ThreadPoolExecutor(max_workers=num_threads) as executor:
-            futures = [executor.submit(process_article, article, content_dir, highlights_dir, api) for article in metadata]
-            for future in as_completed(futures):
-                try:
-                    future.result()  # Get the result (if any)
-                    pbar.update(1)
-                except Exception as e:
-                    logger.error(f"Error processing article", exc_info=True) 
+
+    # Highlight matching only happens for articles with both content and highlights
+    needs_cpu_pool = any(
+        os.path.exists(os.path.join(content_dir, f"{slug}.html")) and
+        os.path.exists(os.path.join(highlights_dir, f"{slug}.md"))
+        for slug in (article.get('slug') for article in metadata) if slug
+    )
+    # Workers are spawned rather than forked: they start lazily while the import
+    # threads are running, and a forked child could inherit a held lock (e.g. tqdm's)
+    cpu_pool = None
+    if needs_cpu_pool:
+        cpu_pool = ProcessPoolExecutor(max_workers=os.cpu_count(),
+                                       mp_context=multiprocessing.get_context('spawn'))
+
+    try:
+        with tqdm(total=len(metadata), desc="Processing Articles") as pbar:
+            with ThreadPoolExecutor(max_workers=num_threads) as executor:
+                futures = [executor.submit(process_article, article, content_dir, highlights_dir, api, cpu_pool) for article in metadata]
+                for future in as_completed(futures):
+                    try:
+                        future.result()  # Get the result (if any)
+                        pbar.update(1)
+                    except Exception as e:
+                        logger.error(f"Error processing article", exc_info=True) 
+    finally:
+        if cpu_pool is not None:
+            cpu_pool.shutdown()
 
 
 def parse_args():
@@ -824,13 +978,15 @@ def parse_args():
                       help='Path to folder containing contents of extracted archive')
     parser.add_argument('--ignore-invalid-certs', action="store_true",
                       help='Bypass validating TLS/SSL certificates during API calls')
+    parser.add_argument('--threads', type=int, default=8,
+                      help='Number of articles to import concurrently (default: 8)')
     return parser.parse_args()
 
 if __name__ == "__main__":
     args = parse_args()
     try:
-        importer = OmnivoreAPI(args.api_url, args.api_key, not args.ignore_invalid_certs)
-        import_folder(importer, args.folder)
+        with OmnivoreAPI(args.api_url, args.api_key, not args.ignore_invalid_certs) as importer:
+            import_folder(importer, args.folder, args.threads)
     except Exception as e:
         logger.error(f"Error: {str(e)}")
         exit(1)
\ No newline at end of file